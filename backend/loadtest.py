@@ -0,0 +1,154 @@
+"""
+Load generator for the /process endpoint.
+
+Sends concurrent uploads of varied image sizes and reports throughput,
+latency percentiles and error rates. Pair it with the synthetic model to
+measure the server's own queueing, I/O and encoding overhead:
+
+    BG_REMOVER_ENABLE_DUMMY=1 BG_REMOVER_DUMMY_LATENCY=0.05 \
+        python -m uvicorn backend.main:app --port 8000
+    python backend/loadtest.py -c 8 -n 200 --sizes 640x480 1920x1080 4000x3000
+"""
+import argparse
+import io
+import random
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageDraw
+
+
+def make_image(width, height, seed):
+    """Deterministic JPEG with some structure so encoders have real work to do."""
+    rng = random.Random(seed)
+    img = Image.new("RGB", (width, height), tuple(rng.randrange(256) for _ in range(3)))
+    draw = ImageDraw.Draw(img)
+    for _ in range(20):
+        x0, y0 = rng.randrange(width), rng.randrange(height)
+        x1, y1 = x0 + rng.randrange(1, width // 2 + 2), y0 + rng.randrange(1, height // 2 + 2)
+        draw.ellipse((x0, y0, x1, y1), fill=tuple(rng.randrange(256) for _ in range(3)))
+    buffer = io.BytesIO()
+    img.save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def encode_multipart(fields, file_field, filename, data, content_type="image/jpeg"):
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+        )
+    parts.append(
+        (f'--{boundary}\r\nContent-Disposition: form-data; name="{file_field}"; filename="{filename}"\r\n'
+         f'Content-Type: {content_type}\r\n\r\n').encode()
+    )
+    parts.append(data)
+    parts.append(f"\r\n--{boundary}--\r\n".encode())
+    return b"".join(parts), f"multipart/form-data; boundary={boundary}"
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def parse_size(text):
+    width, height = text.lower().split("x")
+    return int(width), int(height)
+
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = []
+        self.errors = {}
+        self.bytes_sent = 0
+
+    def record(self, latency, sent, error=None):
+        with self.lock:
+            self.bytes_sent += sent
+            if error is None:
+                self.latencies.append(latency)
+            else:
+                self.errors[error] = self.errors.get(error, 0) + 1
+
+
+def send_request(url, model_id, index, payload, size, stats, timeout):
+    filename = f"loadtest_{index}_{size[0]}x{size[1]}.jpg"
+    body, content_type = encode_multipart({"model_id": model_id}, "file", filename, payload)
+    request = urllib.request.Request(url, data=body, headers={"Content-Type": content_type}, method="POST")
+
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            response.read()
+        stats.record(time.perf_counter() - start, len(body))
+    except urllib.error.HTTPError as e:
+        stats.record(time.perf_counter() - start, len(body), error=f"HTTP {e.code}")
+    except Exception as e:
+        stats.record(time.perf_counter() - start, len(body), error=type(e).__name__)
+
+
+def report(stats, elapsed, total):
+    latencies = sorted(stats.latencies)
+    failed = sum(stats.errors.values())
+
+    print("\n📊 Results")
+    print(f"   Requests:    {total} ({len(latencies)} ok, {failed} failed)")
+    print(f"   Duration:    {elapsed:.2f}s")
+    print(f"   Throughput:  {len(latencies) / elapsed:.2f} req/s")
+    print(f"   Upload:      {stats.bytes_sent / elapsed / 1e6:.2f} MB/s")
+    print(f"   Error rate:  {failed / total * 100 if total else 0:.2f}%")
+    if latencies:
+        print("   Latency (ms):")
+        for pct in (50, 90, 95, 99):
+            print(f"     p{pct:<3} {percentile(latencies, pct) * 1000:8.1f}")
+        print(f"     max  {latencies[-1] * 1000:8.1f}")
+    for error, count in sorted(stats.errors.items()):
+        print(f"   ❌ {error}: {count}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the background removal API.")
+    parser.add_argument("--url", default="http://localhost:8000/process", help="Endpoint to test")
+    parser.add_argument("-m", "--model", default="dummy", help="model_id to send (default: dummy)")
+    parser.add_argument("-c", "--concurrency", type=int, default=4, help="Parallel clients")
+    parser.add_argument("-n", "--requests", type=int, default=100, help="Total requests to send")
+    parser.add_argument(
+        "--sizes",
+        nargs="+",
+        default=["640x480", "1920x1080", "4000x3000"],
+        help="Image sizes to cycle through (WIDTHxHEIGHT)"
+    )
+    parser.add_argument("--timeout", type=float, default=120.0, help="Per request timeout in seconds")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the generated images")
+
+    args = parser.parse_args()
+
+    sizes = [parse_size(s) for s in args.sizes]
+    print(f"🖼️ Generating {len(sizes)} test images...")
+    payloads = [make_image(w, h, args.seed + i) for i, (w, h) in enumerate(sizes)]
+
+    print(f"🚀 Sending {args.requests} requests to {args.url} (concurrency {args.concurrency}, model {args.model})")
+    stats = Stats()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        for i in range(args.requests):
+            k = i % len(sizes)
+            pool.submit(send_request, args.url, args.model, i, payloads[k], sizes[k], stats, args.timeout)
+    elapsed = time.perf_counter() - start
+
+    report(stats, elapsed, args.requests)
+    sys.exit(1 if stats.errors else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,23 +1,72 @@
 from fastapi import FastAPI, UploadFile, File, Form, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
+from starlette.concurrency import run_in_threadpool
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+import asyncio
+import json
 import shutil
 import os
 import sys
+import threading
+import time
+import uuid
 
 # Add parent dir to path so we can import our scripts
 sys.path.append("..") 
 
 # Import our tools
-# Note: We need to make sure these scripts are refactored to be importable
-# (I refactored background_remover.py, others might need it too or we handle it here)
-import background_remover
-import sam2_remover
-import birefnet_remover
-import rmbg2_remover
+# The registry imports each model script on first use
+import remover_engine
 # import upscaler # disabled for now
 
+# Per-model options for the web app.
+# u2net's coarse 320px mask gets guided-filter edge refinement
+# (much faster than rembg's closed-form alpha matting).
+MODEL_OPTIONS = {
+    "u2net": {"refine": os.environ.get("BG_REMOVER_REFINE", "balanced")},
+}
+
+# Opt-in optimized torch profile for the Hugging Face models
+if os.environ.get("BG_REMOVER_OPTIMIZE") == "1":
+    for model_id in ("birefnet", "rmbg2"):
+        MODEL_OPTIONS.setdefault(model_id, {})["optimize"] = True
+
+# The synthetic "dummy" model is only served when enabled for load testing
+SERVED_MODELS = [
+    m for m in remover_engine.available_models()
+    if m != "dummy" or os.environ.get("BG_REMOVER_ENABLE_DUMMY") == "1"
+]
+
+# Weight cache / offline mode come from BG_REMOVER_CACHE_DIR and BG_REMOVER_OFFLINE
+remover_engine.configure_model_cache()
+
+# Models to load and warm up at startup, e.g. BG_REMOVER_WARMUP=rmbg2,birefnet
+WARMUP_MODELS = [m.strip() for m in os.environ.get("BG_REMOVER_WARMUP", "").split(",") if m.strip()]
+WARMUP_RESOLUTIONS = [
+    int(r) for r in os.environ.get("BG_REMOVER_WARMUP_RESOLUTIONS", str(remover_engine.DEFAULT_RESOLUTION)).split(",") if r.strip()
+]
+
+# Reported by /ready; only true once every warmup model has run
+readiness = {"ready": not WARMUP_MODELS, "warmed": [], "error": None}
+
+# Progressive mode: a quick low resolution preview is returned right away
+# and the full result follows as a Server-Sent Event on /events/{request_id}.
+PREVIEW_RESOLUTION = int(os.environ.get("BG_REMOVER_PREVIEW_RESOLUTION", "384"))
+# Optional faster model for previews (e.g. u2net); defaults to the requested model
+PREVIEW_MODEL = os.environ.get("BG_REMOVER_PREVIEW_MODEL", "")
+
+# request_id -> job state, oldest first (capped so it can't grow forever;
+# only finished jobs are evicted)
+jobs = OrderedDict()
+MAX_JOBS = 1000
+# Longest an /events stream waits for a job before giving up (seconds)
+JOB_TIMEOUT = float(os.environ.get("BG_REMOVER_JOB_TIMEOUT", "600"))
+job_executor = ThreadPoolExecutor(max_workers=int(os.environ.get("BG_REMOVER_WORKERS", "1")))
+
 app = FastAPI()
 
 # CORS for frontend
@@ -42,18 +91,153 @@ os.makedirs(PROCESSED_DIR, exist_ok=True)
 app.mount("/processed", StaticFiles(directory=PROCESSED_DIR), name="processed")
 app.mount("/uploads", StaticFiles(directory=UPLOAD_DIR), name="uploads")
 
+def warmup_models():
+    try:
+        for model_id in WARMUP_MODELS:
+            start_time = time.time()
+            remover = remover_engine.get_remover(model_id, **MODEL_OPTIONS.get(model_id, {}))
+            remover.warmup(WARMUP_RESOLUTIONS)
+            print(f"Warmed up {model_id} in {time.time() - start_time:.2f}s")
+            readiness["warmed"].append(model_id)
+        readiness["ready"] = True
+    except Exception as e:
+        print(f"Warmup failed: {e}")
+        readiness["error"] = str(e)
+
+@app.on_event("startup")
+def start_warmup():
+    # Warm up in the background so the server can answer health checks meanwhile
+    if WARMUP_MODELS:
+        threading.Thread(target=warmup_models, daemon=True).start()
+
+@app.get("/health")
+def health():
+    return {"status": "ok"}
+
+@app.get("/ready")
+def ready():
+    status_code = 200 if readiness["ready"] else 503
+    return JSONResponse(status_code=status_code, content=readiness)
+
+def processed_url(filename):
+    # Encode filename for URL
+    return f"http://localhost:8000/processed/{quote(filename)}"
+
+def run_full_job(job, remover, abs_input, abs_output, output_filename):
+    try:
+        remover.process_file(abs_input, abs_output)
+        if not os.path.exists(abs_output) or os.path.getsize(abs_output) == 0:
+            raise RuntimeError("Output file not created.")
+        job["processed_url"] = processed_url(output_filename)
+        job["status"] = "done"
+    except Exception as e:
+        print(f"Error: {e}")
+        import traceback
+        traceback.print_exc()
+        job["detail"] = str(e)
+        job["status"] = "error"
+
+def evict_finished_jobs():
+    # Jobs still queued or running are kept even past the cap
+    if len(jobs) <= MAX_JOBS:
+        return
+    for job_id in [j for j, job in jobs.items() if job["status"] != "processing"]:
+        if len(jobs) <= MAX_JOBS:
+            break
+        del jobs[job_id]
+
+async def start_progressive_job(job_id, model_id, remover, abs_input, abs_output, output_filename, original_url):
+    # Phase 1: low resolution pass, answered directly
+    if PREVIEW_MODEL:
+        preview_remover = await run_in_threadpool(
+            remover_engine.get_remover, PREVIEW_MODEL, **MODEL_OPTIONS.get(PREVIEW_MODEL, {})
+        )
+    else:
+        preview_remover = remover
+    preview_filename = f"preview_{job_id}.png"
+    preview_path = os.path.join(PROCESSED_DIR, preview_filename)
+    preview = await run_in_threadpool(preview_remover.process_preview, abs_input, preview_path, PREVIEW_RESOLUTION)
+
+    job = {
+        "status": "processing",
+        "model_id": model_id,
+        "preview_url": processed_url(preview_filename) if preview else None,
+        "processed_url": None,
+        "detail": None,
+    }
+    jobs[job_id] = job
+    evict_finished_jobs()
+
+    # Phase 2: full resolution result in the background
+    job_executor.submit(run_full_job, job, remover, abs_input, abs_output, output_filename)
+
+    return {
+        "status": "processing",
+        "request_id": job_id,
+        "original_url": original_url,
+        "preview_url": job["preview_url"],
+        "events_url": f"/events/{job_id}",
+    }
+
+def sse_message(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.get("/events/{job_id}")
+async def job_events(job_id: str):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown request id")
+
+    async def stream():
+        yield sse_message("preview", {"request_id": job_id, "preview_url": job["preview_url"]})
+        idle = 0.0
+        deadline = time.monotonic() + JOB_TIMEOUT
+        while job["status"] == "processing":
+            if time.monotonic() > deadline:
+                yield sse_message("error", {
+                    "request_id": job_id,
+                    "processed_url": None,
+                    "detail": "Timed out waiting for the full resolution result",
+                })
+                return
+            await asyncio.sleep(0.1)
+            idle += 0.1
+            if idle >= 15:
+                # Comment line keeps proxies from closing the connection
+                yield ": keep-alive\n\n"
+                idle = 0.0
+        yield sse_message(job["status"], {
+            "request_id": job_id,
+            "processed_url": job["processed_url"],
+            "detail": job["detail"],
+        })
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
 @app.post("/process")
 async def process_image(
     file: UploadFile = File(...),
-    model_id: str = Form(...)
+    model_id: str = Form(...),
+    progressive: bool = Form(False)
 ):
+    if model_id not in SERVED_MODELS:
+        raise HTTPException(status_code=400, detail="Invalid model_id")
+
     try:
+        # Progressive jobs finish after this request returns, so their files
+        # are named after the job; otherwise a second upload with the same
+        # name would overwrite the input while the first job is queued.
+        upload_filename = file.filename
+        if progressive:
+            job_id = uuid.uuid4().hex
+            upload_filename = job_id + os.path.splitext(file.filename)[1]
+
         # Save uploaded file
-        file_location = f"{UPLOAD_DIR}/{file.filename}"
+        file_location = f"{UPLOAD_DIR}/{upload_filename}"
         with open(file_location, "wb") as buffer:
             shutil.copyfileobj(file.file, buffer)
 
-        output_filename = f"processed_{file.filename}"
+        output_filename = f"processed_{upload_filename}"
         if not output_filename.endswith(".png"):
              output_filename = os.path.splitext(output_filename)[0] + ".png"
              
@@ -62,53 +246,26 @@ async def process_image(
         abs_input = os.path.abspath(file_location)
         abs_output = os.path.abspath(output_location)
 
-        # Route to correct model
-        if model_id == "u2net":
-             background_remover.process_image(abs_input, abs_output, model_name="u2net", alpha_matting=True)
-        
-        elif model_id == "sam2":
-             # We need to load model first? 
-             # For API efficiency, ideally we load models globally.
-             # But for now let's use the script's functions which might load internally.
-             # We should probably refactor scripts to allow passing a loaded model, 
-             # OR just accept the hit of reloading (or let the script handle global lazy loading)
-             
-             # sam2_remover.get_sam_model() caches? 
-             # Let's check sam2_remover.py... it uses get_sam_model() inside main.
-             # We should probably reuse the loading logic.
-             # For MVP, let's just make sure the script functions are accessible.
-             # I need to refactor other scripts to expose a 'process' function that takes string paths.
-             
-             # Assuming I will refactor them in next steps, here is the call:
-             model = sam2_remover.get_sam_model() # This should be cached globally ideally
-             sam2_remover.process_sam2(model, abs_input, abs_output)
-
-        elif model_id == "birefnet":
-             model_data = birefnet_remover.get_birefnet_model()
-             birefnet_remover.process_birefnet(model_data, abs_input, abs_output)
+        # Route to correct model.
+        # Models are loaded once and kept in memory between requests.
+        # Loading and inference run in the threadpool so open /events
+        # streams and health checks keep being served meanwhile.
+        remover = await run_in_threadpool(remover_engine.get_remover, model_id, **MODEL_OPTIONS.get(model_id, {}))
 
-        elif model_id == "rmbg2":
-             model_data = rmbg2_remover.get_rmbg2_model()
-             rmbg2_remover.process_rmbg2(model_data, abs_input, abs_output)
-             
-        # elif model_id == "upscaler":
-        #      pipeline = upscaler.get_upscaler_pipe()
-        #      upscaler.upscale_image(pipeline, abs_input, abs_output)
+        if progressive:
+            return await start_progressive_job(
+                job_id, model_id, remover, abs_input, abs_output, output_filename, f"/uploads/{upload_filename}"
+            )
 
-        else:
-             raise HTTPException(status_code=400, detail="Invalid model_id")
+        await run_in_threadpool(remover.process_file, abs_input, abs_output)
 
         if not os.path.exists(abs_output) or os.path.getsize(abs_output) == 0:
             raise HTTPException(status_code=500, detail="Processing failed: Output file not created.")
 
-        # Encode filename for URL
-        from urllib.parse import quote
-        safe_filename = quote(output_filename)
-
         return {
             "status": "success",
             "original_url": f"/uploads/{file.filename}", 
-            "processed_url": f"http://localhost:8000/processed/{safe_filename}"
+            "processed_url": processed_url(output_filename)
         }
 
     except Exception as e:
@@ -1,38 +1,56 @@
 import argparse
-import sys
+import importlib.util
 import os
-import time
-
-# Lazy load heavy imports
-def get_rembg_tools():
-    print("⏳ this might take a moment...")
-    try:
-        from rembg import remove, new_session
-        return remove, new_session
-    except ImportError as e:
-        print(f"❌ Error loading libraries: {e}")
-        sys.exit(1)
-
-def process_image(input_path, output_path, model_name="isnet-general-use"):
-    """
-    Removes the background from an image using a specific model.
-    """
-def process_image(img_path, output_path, model_name="u2net", alpha_matting=False):
-    # Lazy load rembg
-    try:
-        from rembg import remove, new_session
-    except ImportError:
-        # If called from API, we expect deps to be there, or we catch this.
-        # But for CLI we might want to install. 
-        # For now, let's assume if imported, we want to just raise or return False
+from remover_engine import (
+    Remover, register_remover, reconstruct_paths, is_image_file, output_path_for,
+)
+
+# rembg is imported lazily (in RembgRemover) so the CLI starts fast
+
+# "isnet" maps to rembg's general purpose IS-Net model
+@register_remover("u2net", model_name="u2net")
+@register_remover("isnet", model_name="isnet-general-use")
+class RembgRemover(Remover):
+    """Any rembg (ONNX) model, e.g. u2net, isnet-general-use, u2net_human_seg."""
+    label = "rembg"
+
+    def __init__(self, model_name="u2net", alpha_matting=False, **options):
+        super().__init__(**options)
+        self.model_name = model_name
+        self.alpha_matting = alpha_matting
+
+    def _load(self):
+        from rembg import new_session
+        providers = ['CUDAExecutionProvider', 'DirectMLExecutionProvider', 'CPUExecutionProvider']
+        return new_session(self.model_name, providers=providers)
+
+    def mask_input(self, image):
+        # Alpha matting refines edges against the pixels it is given, so it
+        # needs the full resolution image rather than the reduced decode
+        return image.full() if self.alpha_matting else image.model_input
+
+    def predict_masks(self, images, resolution=None):
+        from rembg import remove
+        self.load()
+        masks = []
+        # rembg sessions take one image at a time (fixed 320px input)
+        for image in images:
+            if self.alpha_matting:
+                cutout = remove(image, session=self.model, alpha_matting=True, alpha_matting_foreground_threshold=240, alpha_matting_background_threshold=10, alpha_matting_erode_size=10)
+                masks.append(cutout.getchannel("A"))
+            else:
+                masks.append(remove(image, session=self.model, only_mask=True))
+        return masks
+
+def process_image(img_path, output_path, model_name="u2net", alpha_matting=False, mask_only=False, remover=None):
+    # Only check that rembg is installed; it is imported when the model loads
+    if importlib.util.find_spec("rembg") is None:
         if __name__ == "__main__":
              # install_dependencies() # This function is not defined, so we'll just raise
              raise ImportError("rembg not installed. Please install it using 'pip install rembg[gpu]' or 'pip install rembg'")
         else:
              raise ImportError("rembg not installed")
 
-    # ... check deps ...
-
     try:
         print(f"Processing: {img_path}...")
         print(f"Using Model: {model_name}")
@@ -40,31 +58,14 @@ def process_image(img_path, output_path, model_name="u2net", alpha_matting=False
         if not os.path.exists(img_path):
             raise FileNotFoundError(f"The file '{img_path}' was not found.")
 
-        # Read image
-        print("📖 Reading image...")
-        with open(img_path, 'rb') as i:
-            input_data = i.read()
-
-        # ... (rest of processing)
-        
         # Setup Session
-        # We can cache sessions in the backend later, for now new session every time is safer for script reuse
-        # but slower. backend optimization: global cache.
-        print("🪄 Removing background...")
-        providers = ['CUDAExecutionProvider', 'DirectMLExecutionProvider', 'CPUExecutionProvider']
-        session = new_session(model_name, providers=providers)
+        # A new session per call unless the caller passes a loaded remover
+        # (main() and the API server reuse one).
+        if remover is None:
+            remover = RembgRemover(model_name=model_name, alpha_matting=alpha_matting)
 
-        if alpha_matting:
-             output_data = remove(input_data, session=session, alpha_matting=True, alpha_matting_foreground_threshold=240, alpha_matting_background_threshold=10, alpha_matting_erode_size=10)
-        else:
-             output_data = remove(input_data, session=session)
-
-        print("💾 Saving result...")
-        with open(output_path, 'wb') as o:
-            o.write(output_data)
-            
-        print(f"✅ Saved to: {output_path}")
-        return output_path
+        print("🪄 Removing background...")
+        return remover.process_file(img_path, output_path, mask_only=mask_only)
 
     except Exception as e:
         print(f"❌ Error: {e}")
@@ -82,46 +83,8 @@ def main():
 
     args = parser.parse_args()
 
-    # Reconstruct paths that might have been split by spaces (if quotes were missing)
-    def reconstruct_paths(raw_args):
-        cleaned_paths = []
-        current_path = []
-        
-        for arg in raw_args:
-             # If arg is a flag or looks like one, we shouldn't be here (argparse handles it), 
-             # but just in case, or if it's the start of a new file.
-             
-             # Heuristic:
-             # 1. Add part to current_path.
-             # 2. Check if current_path exists. 
-             # 3. If exists, save it and reset current_path.
-             # 4. If not, keep accumulating (unless we run out, then assume the user gave a bad path or a list of bad paths, 
-             #    in which case we probably output the accumulated chunks as best effort).
-             
-             # Better Heuristic for "Nargs+" where some are split:
-             # We want to greedily match the longest existing prefix? No, usually valid paths don't overlap.
-             # We accumulate until we find a match?
-             
-             current_path.append(arg)
-             candidate = " ".join(current_path)
-             
-             # Check if this candidate is a file or directory
-             # Also check if we strip quotes (though arg usually has them stripped by shell)
-             candidate_clean = candidate.strip('"').strip("'")
-             
-             if os.path.exists(candidate_clean):
-                 cleaned_paths.append(candidate_clean)
-                 current_path = []
-        
-        # If leftovers (e.g. file doesn't exist), we might have skipped it or it's a typo.
-        # But we should probably add it to the list to let the main loop report "File not found" correctly
-        # instead of failing silently.
-        if current_path:
-            cleaned_paths.append(" ".join(current_path).strip('"').strip("'"))
-            
-        return cleaned_paths
-
     # Process inputs
+    # (reconstructs paths that might have been split by spaces if quotes were missing)
     input_list = reconstruct_paths(args.input)
 
     # Determine if output is a directory or file (or None)
@@ -136,31 +99,18 @@ def main():
         print("⚠️ Warning: Multiple inputs detected, but output is not a directory. Output will be saved in source directories.")
         output_target = None 
 
+    # One session for all inputs
+    remover = RembgRemover(model_name=args.model)
+
     for input_path in input_list:
         if not input_path: continue
         
-        # Verify extension
-        valid_exts = {'.jpg', '.jpeg', '.png', '.bmp', '.webp'}
-        ext = os.path.splitext(input_path)[1].lower()
-        if ext not in valid_exts:
+        if not is_image_file(input_path):
             print(f"⚠️ Skipping non-image file: {input_path}")
             continue
 
-        if not output_target:
-             # Generate output path in the same location
-            base, ext = os.path.splitext(input_path)
-            if not ext: ext = ".png"
-            output_path = f"{base}_no_bg.png"
-        elif os.path.isdir(output_target):
-            # Output is a directory
-            filename = os.path.basename(input_path)
-            base, ext = os.path.splitext(filename)
-            output_path = os.path.join(output_target, f"{base}_no_bg.png")
-        else:
-             # Single input, single output file
-             output_path = output_target
-
-        process_image(input_path, output_path, args.model)
+        output_path = output_path_for(input_path, output_target, "_no_bg")
+        process_image(input_path, output_path, args.model, remover=remover)
 
 if __name__ == "__main__":
     main()
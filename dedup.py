@@ -0,0 +1,188 @@
+"""
+Near-duplicate detection so the same shot at a different size or
+compression reuses an already computed mask instead of running the model.
+
+Each image is reduced to a 64-bit perceptual hash (pHash or dHash). Two
+images whose hashes differ in at most `threshold` bits (and whose aspect
+ratios match) are treated as the same picture; the stored mask is simply
+resampled to the new size when it is saved.
+"""
+import json
+import math
+import os
+import numpy as np
+from PIL import Image
+
+HASH_METHODS = ("phash", "dhash")
+DEFAULT_THRESHOLD = 4
+
+# Aspect ratios must match this closely (log ratio) to count as duplicates,
+# so crops of the same photo are not mistaken for resizes
+ASPECT_TOLERANCE = 0.02
+
+
+def _dct_matrix(n):
+    k = np.arange(n).reshape(-1, 1)
+    x = np.arange(n).reshape(1, -1)
+    return np.cos(np.pi * (2 * x + 1) * k / (2 * n))
+
+_DCT_32 = _dct_matrix(32)
+
+
+def _bits_to_int(bits):
+    value = 0
+    for bit in bits:
+        value = (value << 1) | int(bit)
+    return value
+
+
+def phash(image):
+    """DCT based hash: robust to resizing, recompression and small colour changes."""
+    pixels = np.asarray(image.convert("L").resize((32, 32), Image.Resampling.LANCZOS), dtype=np.float64)
+    dct = _DCT_32 @ pixels @ _DCT_32.T
+    low = dct[:8, :8].flatten()
+    # The DC term says nothing about structure, so leave it out of the median
+    return _bits_to_int(low > np.median(low[1:]))
+
+
+def dhash(image):
+    """Gradient hash: cheaper than pHash, slightly less robust."""
+    pixels = np.asarray(image.convert("L").resize((9, 8), Image.Resampling.LANCZOS), dtype=np.int16)
+    return _bits_to_int((pixels[:, 1:] > pixels[:, :-1]).flatten())
+
+
+def _popcount64(values):
+    """Number of set bits in each element of a uint64 array."""
+    return np.unpackbits(values.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+
+
+class MaskIndex:
+    """
+    Hash -> mask lookup over the current batch and, if `cache_dir` is
+    given, masks saved by previous runs. `namespace` separates models
+    (a u2net mask must not be reused for rmbg2).
+    """
+
+    def __init__(self, method="phash", threshold=DEFAULT_THRESHOLD, cache_dir=None, namespace="default"):
+        if method not in HASH_METHODS:
+            raise ValueError(f"Unknown hash method '{method}'. Options: {', '.join(HASH_METHODS)}")
+        self.method = method
+        self.threshold = threshold
+        self.hash_fn = phash if method == "phash" else dhash
+
+        self.hashes = []
+        self.aspects = []
+        # In-memory masks, or None where the mask lives in the cache dir
+        self.masks = []
+        # Cache file name of each mask
+        self.files = []
+        self._array = None
+
+        self.lookups = 0
+        self.reused = 0
+
+        self.cache_dir = os.path.join(cache_dir, namespace, method) if cache_dir else None
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            self._load_cache()
+
+    # --- Persistent cache ---
+
+    @property
+    def _index_path(self):
+        return os.path.join(self.cache_dir, "index.json")
+
+    def _load_cache(self):
+        try:
+            with open(self._index_path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            return
+        if not isinstance(entries, list):
+            # Index from an older version, keyed by hash only: start over
+            return
+        for entry in entries:
+            self.hashes.append(int(entry["hash"], 16))
+            self.aspects.append(entry["aspect"])
+            self.masks.append(None)
+            self.files.append(entry["file"])
+
+    def save(self):
+        """Writes the index of cached masks (no-op without a cache dir)."""
+        if not self.cache_dir:
+            return
+        entries = [
+            {"hash": f"{h:016x}", "aspect": a, "file": name}
+            for h, a, name in zip(self.hashes, self.aspects, self.files)
+        ]
+        tmp_path = self._index_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entries, f)
+        os.replace(tmp_path, self._index_path)
+
+    def checkpoint(self):
+        """State to return to with rollback() if a batch fails part way."""
+        return len(self.hashes), self.lookups, self.reused
+
+    def rollback(self, state):
+        """
+        Forgets masks added and lookups counted since checkpoint(), so a
+        retried batch is not counted twice or credited with reusing the
+        masks it computed itself.
+        """
+        count, self.lookups, self.reused = state
+        for entries in (self.hashes, self.aspects, self.masks, self.files):
+            del entries[count:]
+        self._array = None
+
+    # --- Lookup ---
+
+    def image_key(self, image):
+        """(hash, aspect ratio) for a PIL image."""
+        w, h = image.size
+        return self.hash_fn(image), w / h
+
+    def matches(self, key_a, key_b):
+        """True if two (hash, aspect) keys are near-duplicates."""
+        distance = bin(key_a[0] ^ key_b[0]).count("1")
+        return distance <= self.threshold and abs(math.log(key_a[1] / key_b[1])) <= ASPECT_TOLERANCE
+
+    def find(self, key):
+        """Returns a mask for a near-duplicate of `key`, or None."""
+        self.lookups += 1
+        if not self.hashes:
+            return None
+        if self._array is None:
+            self._array = np.array(self.hashes, dtype=np.uint64)
+
+        image_hash, aspect = key
+        distances = _popcount64(self._array ^ np.uint64(image_hash))
+        for i in np.argsort(distances, kind="stable"):
+            if distances[i] > self.threshold:
+                break
+            if abs(math.log(aspect / self.aspects[i])) > ASPECT_TOLERANCE:
+                continue
+            mask = self.masks[i]
+            if mask is None:
+                try:
+                    mask = Image.open(os.path.join(self.cache_dir, self.files[i]))
+                    mask.load()
+                except OSError:
+                    continue
+                self.masks[i] = mask
+            self.reused += 1
+            return mask
+        return None
+
+    def add(self, key, mask):
+        image_hash, aspect = key
+        mask = mask.convert("L")
+        self.hashes.append(image_hash)
+        self.aspects.append(aspect)
+        self.masks.append(mask)
+        # The entry number keeps same-hash masks (e.g. other aspect ratios) apart
+        name = f"{image_hash:016x}_{len(self.files)}.png"
+        self.files.append(name)
+        self._array = None
+        if self.cache_dir:
+            mask.save(os.path.join(self.cache_dir, name))
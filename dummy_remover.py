@@ -0,0 +1,43 @@
+import os
+import time
+from PIL import Image, ImageDraw
+from remover_engine import Remover, register_remover
+
+# Seconds of simulated inference per image (override per instance with latency=)
+DEFAULT_LATENCY = float(os.environ.get("BG_REMOVER_DUMMY_LATENCY", "0.05"))
+
+
+@register_remover("dummy")
+class DummyRemover(Remover):
+    """
+    Stand-in model for load testing and development. Needs no weights or
+    GPU: it sleeps for `latency` seconds per image and returns a centered
+    ellipse mask, so the same input always gives the same output.
+    """
+    label = "Dummy"
+
+    def __init__(self, latency=DEFAULT_LATENCY, **options):
+        super().__init__(**options)
+        self.latency = latency
+
+    def _load(self):
+        return "dummy"
+
+    def pull(self):
+        pass
+
+    def predict_masks(self, images, resolution=None):
+        resolution = resolution or self.resolution
+        time.sleep(self.latency * len(images))
+
+        masks = []
+        for image in images:
+            # Same aspect ratio as the input, no larger than the model resolution
+            w, h = image.size
+            scale = min(1.0, resolution / max(w, h))
+            size = (max(1, int(w * scale)), max(1, int(h * scale)))
+            mask = Image.new("L", size, 0)
+            draw = ImageDraw.Draw(mask)
+            draw.ellipse((size[0] * 0.2, size[1] * 0.1, size[0] * 0.8, size[1] * 0.9), fill=255)
+            masks.append(mask)
+        return masks
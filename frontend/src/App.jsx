@@ -8,6 +8,8 @@ function App() {
   const [processedUrl, setProcessedUrl] = useState(null)
   const [isProcessing, setIsProcessing] = useState(false)
   const [model, setModel] = useState("rmbg2") // Default to SOTA/Newest
+  const [isRefining, setIsRefining] = useState(false) // Preview shown, full result pending
+  const eventSourceRef = useRef(null)
 
   // Handle Drag & Drop / File Select
   const handleFileChange = (e) => {
@@ -16,16 +18,49 @@ function App() {
       setSelectedFile(file)
       setPreviewUrl(URL.createObjectURL(file))
       setProcessedUrl(null) // Reset result
+      closeEvents()
     }
   }
 
+  const closeEvents = () => {
+    if (eventSourceRef.current) {
+      eventSourceRef.current.close()
+      eventSourceRef.current = null
+    }
+    setIsRefining(false)
+  }
+
+  // Progressive mode: show the quick preview, then swap in the full result
+  const listenForResult = (eventsUrl) => {
+    closeEvents()
+    setIsRefining(true)
+    const events = new EventSource("http://localhost:8000" + eventsUrl)
+    eventSourceRef.current = events
+
+    events.addEventListener("done", (e) => {
+      const data = JSON.parse(e.data)
+      setProcessedUrl(data.processed_url + "?t=" + new Date().getTime())
+      closeEvents()
+    })
+    events.addEventListener("error", (e) => {
+      // Server-sent "error" events carry data; connection errors don't
+      if (e.data) {
+        console.error("Processing failed:", JSON.parse(e.data).detail)
+        alert("Failed to process image.")
+      }
+      closeEvents()
+    })
+  }
+
   const handleUpload = async () => {
     if (!selectedFile) return
 
     setIsProcessing(true)
+    closeEvents()
     const formData = new FormData()
     formData.append("file", selectedFile)
     formData.append("model_id", model)
+    formData.append("progressive", "true")
 
     try {
       // Backend is on port 8000
@@ -36,6 +71,11 @@ function App() {
       if (response.data.status === "success") {
         // Add random query param to force reload if name is same
         setProcessedUrl(response.data.processed_url + "?t=" + new Date().getTime())
+      } else if (response.data.status === "processing") {
+        if (response.data.preview_url) {
+          setProcessedUrl(response.data.preview_url)
+        }
+        listenForResult(response.data.events_url)
       }
     } catch (error) {
       console.error("Error uploading:", error)
@@ -146,14 +186,14 @@ function App() {
           <div className="lg:col-span-8 flex flex-col h-full">
             <div className="bg-gray-200 dark:bg-gray-800 border-4 border-black dark:border-white rounded-3xl slush-shadow relative flex-grow min-h-[500px] overflow-hidden group flex items-center justify-center p-4">
 
-              {!processedUrl && !isProcessing && (
+              {!processedUrl && !isProcessing && !isRefining && (
                 <div className="flex flex-col items-center justify-center text-center opacity-40">
                   <span className="material-icons-round text-6xl mb-4">image</span>
                   <p className="font-display text-2xl uppercase">Upload an image to start</p>
                 </div>
               )}
 
-              {isProcessing && (
+              {(isProcessing || (isRefining && !processedUrl)) && (
                 <div className="flex flex-col items-center justify-center text-center animate-pulse">
                   <span className="material-icons-round text-6xl mb-4 text-primary animate-spin">autorenew</span>
                   <p className="font-display text-2xl uppercase">Removing Background...</p>
@@ -172,6 +212,13 @@ function App() {
               )}
 
 
+              {isRefining && (
+                <div className="absolute bottom-4 left-1/2 -translate-x-1/2 bg-black/70 text-white px-4 py-2 rounded-full text-xs font-bold backdrop-blur-sm pointer-events-none z-10 flex items-center gap-2">
+                  <span className="material-icons-round text-sm animate-spin">autorenew</span>
+                  REFINING FULL RESOLUTION...
+                </div>
+              )}
+
               {/* Labels */}
               <div className="absolute top-4 left-4 bg-black/50 text-white px-3 py-1 rounded-full text-xs font-bold backdrop-blur-sm pointer-events-none z-10">ORIGINAL</div>
               <div className="absolute top-4 right-4 bg-primary text-black px-3 py-1 rounded-full text-xs font-bold shadow-md pointer-events-none z-10">REMOVED</div>
@@ -180,7 +227,7 @@ function App() {
             {/* Actions */}
             <div className="mt-6 flex flex-col sm:flex-row justify-between items-center gap-4">
               <div className="flex items-center gap-4 w-full justify-end">
-                {processedUrl && (
+                {processedUrl && !isRefining && (
                   <a
                     href={processedUrl}
                     download="removed_background.png"
@@ -0,0 +1,127 @@
+from PIL import Image, ImageOps
+
+# All of our segmentation models resize their input to this (or smaller)
+MODEL_INPUT_SIZE = (1024, 1024)
+
+EXIF_ORIENTATION_TAG = 0x0112
+
+
+class LazyImage:
+    """
+    Wraps an image file so that the model input and the full resolution
+    image are decoded separately and only when needed.
+
+    `source` can be a file path or a binary file object (e.g. BytesIO).
+    """
+
+    def __init__(self, source, target_size=MODEL_INPUT_SIZE):
+        self.source = source
+        self.target_size = target_size
+        self.name = source if isinstance(source, str) else getattr(source, "name", "<stream>")
+
+        # Opening only reads the header, so size and EXIF are cheap here
+        with self._open() as img:
+            self.format = img.format
+            self.orientation = img.getexif().get(EXIF_ORIENTATION_TAG, 1)
+            w, h = img.size
+
+        # Orientations 5-8 rotate by 90 degrees, so width and height swap
+        if self.orientation in (5, 6, 7, 8):
+            w, h = h, w
+        self.size = (w, h)
+
+        self._model_input = None
+        self._full = None
+
+    def _open(self):
+        if not isinstance(self.source, str):
+            self.source.seek(0)
+        return Image.open(self.source)
+
+    def _decode(self, draft_size=None):
+        img = self._open()
+        if draft_size is not None:
+            # JPEG only: lets libjpeg decode at 1/2, 1/4 or 1/8 scale.
+            # The chosen scale never goes below the requested size.
+            img.draft("RGB", draft_size)
+        img = ImageOps.exif_transpose(img)
+        if img.mode != "RGB":
+            img = img.convert("RGB")
+        return img
+
+    @property
+    def model_input(self):
+        """RGB image decoded at (or slightly above) the model input size."""
+        if self._model_input is None:
+            # Orientation may swap the axes, so ask for the larger side on both
+            side = max(self.target_size)
+            self._model_input = self._decode(draft_size=(side, side))
+        return self._model_input
+
+    def full(self):
+        """Full resolution RGB image, used for the final composite."""
+        if self._full is None:
+            if self._model_input is not None and self._model_input.size == self.size:
+                # Draft mode had no effect (not a JPEG, or already small)
+                self._full = self._model_input
+            else:
+                self._full = self._decode()
+        return self._full
+
+    def crop(self, box, min_side):
+        """
+        Crops `box` (left, top, right, bottom as fractions of the image)
+        from a decode just large enough that both sides of the crop are at
+        least `min_side` pixels (or full resolution, if that is smaller).
+        """
+        left, top, right, bottom = box
+        w, h = self.size
+        crop_side = max(1.0, min((right - left) * w, (bottom - top) * h))
+        scale = min_side / crop_side
+
+        if self._full is not None or scale >= 1.0:
+            img = self.full()
+        elif self._model_input is not None and min(self._model_input.size) >= scale * min(w, h):
+            img = self.model_input
+        else:
+            need = (int(w * scale + 1), int(h * scale + 1))
+            # Draft works in stored orientation
+            if self.orientation in (5, 6, 7, 8):
+                need = (need[1], need[0])
+            img = self._decode(draft_size=need)
+            if img.size == self.size:
+                # Draft had no effect (not a JPEG): keep it for the composite
+                self._full = img
+
+        W, H = img.size
+        return img.crop((int(left * W), int(top * H), int(round(right * W)), int(round(bottom * H))))
+
+    def release(self):
+        """Drop decoded pixel data so large batches do not pile up in memory."""
+        self._model_input = None
+        self._full = None
+
+
+def save_result(image, mask, output_path, mask_only=False):
+    """
+    Scales `mask` to the original image size and writes either the mask
+    alone or the RGBA cutout. In mask-only mode the full resolution image
+    is never decoded.
+    """
+    if mask.mode != "L":
+        mask = mask.convert("L")
+    if mask.size != image.size:
+        mask = mask.resize(image.size, Image.Resampling.LANCZOS)
+
+    # File objects (streaming mode) have no extension to infer the format from
+    fmt = None if isinstance(output_path, str) else "PNG"
+
+    if mask_only:
+        mask.save(output_path, format=fmt)
+        return output_path
+
+    final_img = image.full()
+    final_img.putalpha(mask)
+    final_img.save(output_path, format=fmt)
+    image.release()
+    return output_path
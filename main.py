@@ -4,43 +4,40 @@ import os
 import time
 
 # Import local modules
-# We wrap imports in try-except block in case dependencies are not installed, 
-# though we will check them before running.
-try:
-    import background_remover
-    import birefnet_remover
-    import rmbg2_remover
-    import sam2_remover
-except ImportError:
-    pass # Will be handled if execution fails or we can check explicitly
-
-def validate_input_paths(input_paths):
+# Model scripts (and their heavy dependencies) are imported by the
+# registry on first use, so only the engine is needed here.
+import remover_engine
+from matting import QUALITY_PRESETS
+
+def enable_optimize(remover, name):
+    if remover.supports_optimize:
+        remover.optimize = True
+    else:
+        print(f"ℹ️ --optimize has no effect for {name} (torch models only)")
+
+
+def build_remover(args):
     """
-    Validates input paths and expands them if they were split by shell arguments.
+    Creates and loads the remover for `remove` / `watch` from CLI options.
     """
-    cleaned_paths = []
-    current_path = []
-    
-    for arg in input_paths:
-        current_path.append(arg)
-        candidate = " ".join(current_path)
-        candidate_clean = candidate.strip('"').strip("'")
-        
-        if os.path.exists(candidate_clean):
-            cleaned_paths.append(candidate_clean)
-            current_path = []
-            
-    if current_path:
-        # Fallback for last item
-        cleaned_paths.append(" ".join(current_path).strip('"').strip("'"))
-        
-    return cleaned_paths
+    options = {}
+    if args.refine:
+        options["refine"] = args.refine
+    if getattr(args, "roi", None):
+        options.update(roi=args.roi, roi_padding=args.roi_padding)
+
+    remover = remover_engine.create_remover(args.model, **options)
+    if args.optimize:
+        enable_optimize(remover, args.model)
+    return remover.load()
+
 
 def process_removal(args):
     """
     Handles the background removal logic dispatch.
     """
-    input_list = validate_input_paths(args.input)
+    # Rejoin paths that were split by shell arguments
+    input_list = remover_engine.reconstruct_paths(args.input)
     if not input_list:
         print("❌ Error: No valid input files found.")
         return
@@ -55,34 +52,19 @@ def process_removal(args):
     print(f"🚀 Starting Background Removal using model: {args.model}")
     print(f"   Inputs: {len(input_list)} files")
 
-    # Load Model (Lazy Loading)
-    model_data = None
-    
-    if args.model == "birefnet":
-        try:
-            model_data = birefnet_remover.get_birefnet_model()
-        except Exception as e:
-            print(f"❌ Failed to load BiRefNet: {e}")
-            sys.exit(1)
-            
-    elif args.model == "rmbg2":
-        try:
-            model_data = rmbg2_remover.get_rmbg2_model()
-        except Exception as e:
-            print(f"❌ Failed to load RMBG-2.0: {e}")
-            sys.exit(1)
-            
-    elif args.model == "sam2":
-        try:
-            model_data = sam2_remover.get_sam_model()
-        except Exception as e:
-            print(f"❌ Failed to load SAM 2: {e}")
-            sys.exit(1)
+    # Load Model once for all inputs
+    try:
+        remover = build_remover(args)
+    except Exception as e:
+        print(f"❌ Failed to load {args.model}: {e}")
+        sys.exit(1)
 
     # Process Loop
     start_time = time.time()
     success_count = 0
+    suffix = "_mask" if args.mask_only else "_no_bg"
     
+    jobs = []
     for str_path in input_list:
         if not os.path.exists(str_path):
              print(f"⚠️ File not found: {str_path}")
@@ -101,34 +83,181 @@ def process_removal(args):
                 os.makedirs(os.path.dirname(os.path.abspath(final_output_path)), exist_ok=True)
             else:
                 os.makedirs(output_dir, exist_ok=True)
-                final_output_path = os.path.join(output_dir, f"{base}_no_bg.png")
+                final_output_path = os.path.join(output_dir, f"{base}{suffix}.png")
         else:
-            final_output_path = f"{base}_no_bg.png"
+            final_output_path = f"{base}{suffix}.png"
 
-        # Dispatch
-        try:
-            if args.model == "u2net" or args.model == "isnet":
-                # Using general background_remover (rembg)
-                # It handles its own session loading usually, or we can look at its code.
-                # background_remover.process_image loads 'u2net' by default or passed arg.
-                background_remover.process_image(str_path, final_output_path, model_name=args.model)
-                
-            elif args.model == "birefnet":
-                birefnet_remover.process_birefnet(model_data, str_path, final_output_path)
-                
-            elif args.model == "rmbg2":
-                rmbg2_remover.process_rmbg2(model_data, str_path, final_output_path)
-                
-            elif args.model == "sam2":
-                sam2_remover.process_sam2(model_data, str_path, final_output_path)
-            
-            success_count += 1
-            
-        except Exception as e:
-             print(f"❌ Failed to process {filename}: {e}")
+        jobs.append((str_path, final_output_path))
+
+    # Optional near-duplicate mask reuse
+    dedup_index = None
+    if args.dedup:
+        import dedup
+        # Masks are only interchangeable between runs with the same settings
+        namespace = f"{args.model}_{remover.resolution}"
+        if remover.roi:
+            namespace += f"_roi-{remover.roi}-{remover.roi_padding}"
+        dedup_index = dedup.MaskIndex(
+            method=args.dedup,
+            threshold=args.dedup_threshold,
+            cache_dir=args.dedup_cache,
+            namespace=namespace,
+        )
+
+    # Dispatch in batches (one model call per batch)
+    batch_size = max(1, args.batch_size)
+    for i in range(0, len(jobs), batch_size):
+        results = remover.process_batch_isolated(jobs[i:i + batch_size], mask_only=args.mask_only, dedup=dedup_index)
+        success_count += sum(error is None for _, error in results)
 
     total_time = time.time() - start_time
     print(f"\n✨ Completed {success_count}/{len(input_list)} images in {total_time:.2f}s")
+    if dedup_index is not None:
+        dedup_index.save()
+        print(f"♻️ Reused masks for {dedup_index.reused} of {dedup_index.lookups} images (near-duplicates skipped the model)")
+
+
+def manage_models(args):
+    """
+    Handles `models pull` / `models warmup` / `models list` / `models benchmark`.
+    """
+    models = args.models or remover_engine.available_models()
+
+    if args.models_command == "benchmark":
+        benchmark_models(models, args)
+        return
+
+    if args.models_command == "list":
+        cache_dir = remover_engine.model_cache_path()
+        print(f"📦 Model cache: {cache_dir or 'library defaults'}")
+        for name in models:
+            print(f"   {name}")
+        return
+
+    failed = []
+    for name in models:
+        start_time = time.time()
+        try:
+            remover = remover_engine.create_remover(name)
+            if getattr(args, "optimize", False):
+                enable_optimize(remover, name)
+            if args.models_command == "pull":
+                print(f"⬇️ Pulling {name}...")
+                remover.pull()
+            else:
+                print(f"🔥 Warming up {name} at {', '.join(map(str, args.resolutions))}px...")
+                remover.warmup(args.resolutions, runs=args.runs)
+            print(f"✅ {name} ready in {time.time() - start_time:.2f}s")
+        except Exception as e:
+            print(f"❌ {name} failed: {e}")
+            failed.append(name)
+
+    if failed:
+        sys.exit(1)
+
+
+def benchmark_models(models, args):
+    """
+    Times each model in the default profile and, for torch models, in
+    the optimized profile (compile, channels-last, inference_mode).
+    """
+    import gc
+
+    def summary(timings):
+        per_image = sorted(t / args.batch_size * 1000 for t in timings)
+        return sum(per_image) / len(per_image), per_image[len(per_image) // 2]
+
+    for name in models:
+        for resolution in args.resolutions:
+            print(f"\n⏱️ {name} @ {resolution}px, batch {args.batch_size}, {args.runs} runs")
+            results = {}
+            for profile in ("baseline", "optimized"):
+                remover = remover_engine.create_remover(name)
+                if profile == "optimized":
+                    if not remover.supports_optimize:
+                        break
+                    remover.optimize = True
+                try:
+                    timings = remover_engine.benchmark(remover, resolution, args.batch_size, args.runs)
+                except Exception as e:
+                    print(f"   ❌ {profile} failed: {e}")
+                    break
+                finally:
+                    # Only one copy of the weights in memory at a time
+                    del remover
+                    gc.collect()
+                results[profile] = summary(timings)
+                mean, p50 = results[profile]
+                print(f"   {profile:<10} mean {mean:8.1f} ms/img   p50 {p50:8.1f} ms/img")
+
+            if len(results) == 2:
+                print(f"   speedup    {results['baseline'][0] / results['optimized'][0]:.2f}x")
+
+
+def stream_images(args):
+    """
+    Handles `stream`: images on stdin, results on stdout.
+    """
+    import tarfile
+    import stream_io
+
+    # From here on, anything printed goes to stderr
+    out = stream_io.claim_stdout()
+
+    try:
+        remover = build_remover(args)
+    except Exception as e:
+        print(f"❌ Failed to load {args.model}: {e}")
+        sys.exit(1)
+
+    start_time = time.time()
+    try:
+        processed, failed = stream_io.process_stream(
+            remover,
+            sys.stdin.buffer,
+            out,
+            input_format=args.input_format,
+            output_format=args.output_format,
+            batch_size=max(1, args.batch_size),
+            mask_only=args.mask_only,
+        )
+    except (EOFError, tarfile.TarError) as e:
+        # Results for everything read before the break have been written
+        print(f"❌ Input stream is broken: {e}")
+        sys.exit(1)
+    print(f"✨ Streamed {processed} images ({failed} failed) in {time.time() - start_time:.2f}s")
+    if failed:
+        sys.exit(1)
+
+
+def watch_folder(args):
+    """
+    Handles `watch`: keeps the model loaded and processes new files as they arrive.
+    """
+    import watcher
+
+    if not os.path.isdir(args.directory):
+        print(f"❌ Error: Not a directory: {args.directory}")
+        sys.exit(1)
+
+    try:
+        remover = build_remover(args)
+    except Exception as e:
+        print(f"❌ Failed to load {args.model}: {e}")
+        sys.exit(1)
+
+    watcher.FolderWatcher(
+        remover,
+        args.directory,
+        output_dir=args.output,
+        recursive=args.recursive,
+        settle=args.settle,
+        batch_window=args.batch_window,
+        batch_size=args.batch_size,
+        mask_only=args.mask_only,
+        poll_interval=args.poll_interval,
+        use_polling=args.poll,
+    ).run()
 
 
 def main():
@@ -137,30 +266,179 @@ def main():
         formatter_class=argparse.RawTextHelpFormatter
     )
     
+    # Options shared by every command that touches model weights
+    cache_parser = argparse.ArgumentParser(add_help=False)
+    cache_parser.add_argument(
+        "--cache-dir",
+        help="Directory for all model weights (default: $BG_REMOVER_CACHE_DIR or each library's default)"
+    )
+    cache_parser.add_argument(
+        "--offline",
+        action="store_true",
+        help="Never download; only use weights already in the cache"
+    )
+
     subparsers = parser.add_subparsers(dest="command", help="Available commands")
     
     # Remove Command
-    remove_parser = subparsers.add_parser("remove", help="Remove background from images")
+    remove_parser = subparsers.add_parser("remove", parents=[cache_parser], help="Remove background from images")
     remove_parser.add_argument("-i", "--input", required=True, nargs='+', help="Input image path(s)")
     remove_parser.add_argument("-o", "--output", help="Output path or directory")
     remove_parser.add_argument(
         "-m", "--model", 
         default="u2net", 
-        choices=["u2net", "isnet", "birefnet", "rmbg2", "sam2"], 
+        choices=remover_engine.available_models(), 
         help=(
             "Select AI Model:\n"
             "  u2net    : Balanced (Default, uses rembg)\n"
             "  isnet    : High accuracy for general use (uses rembg)\n"
             "  birefnet : State-of-the-art segmentation\n"
             "  rmbg2    : RMBG v2.0 (High accuracy)\n"
-            "  sam2     : Segment Anything Model 2 (Subject detection)"
+            "  sam2     : Segment Anything Model 2 (Subject detection)\n"
+            "  dummy    : Synthetic masks, no weights (for testing)"
+        )
+    )
+    remove_parser.add_argument(
+        "--mask-only",
+        action="store_true",
+        help="Save only the grayscale mask (skips decoding the full resolution image)"
+    )
+    remove_parser.add_argument(
+        "--refine",
+        choices=list(QUALITY_PRESETS),
+        help="Refine mask edges (hair, fur) with a guided filter: fast, balanced or best"
+    )
+    remove_parser.add_argument(
+        "--optimize",
+        action="store_true",
+        help="Optimized torch profile (torch.compile, channels-last, inference_mode).\nbirefnet/rmbg2 only; falls back to eager mode if compilation fails"
+    )
+    remove_parser.add_argument(
+        "--roi",
+        nargs="?",
+        const="self",
+        # The synthetic dummy model can't locate anything
+        choices=["self"] + [m for m in remover_engine.available_models() if m != "dummy"],
+        help=(
+            "Two-stage mode for small subjects: locate the subject with a cheap pass,\n"
+            "then run the model only on the padded crop. Locator: 'self' (256px pass\n"
+            "of the same model, default) or a model id such as u2net"
         )
     )
+    remove_parser.add_argument(
+        "--roi-padding",
+        type=float,
+        default=0.1,
+        help="Padding around the located subject, as a fraction of its size (default: 0.1)"
+    )
+    remove_parser.add_argument(
+        "--dedup",
+        nargs="?",
+        const="phash",
+        choices=["phash", "dhash"],
+        help="Reuse masks for near-duplicate images (same shot, other size/compression). Hash: phash (default) or dhash"
+    )
+    remove_parser.add_argument(
+        "--dedup-threshold",
+        type=int,
+        default=4,
+        help="Max differing hash bits (of 64) to count as a duplicate (default: 4)"
+    )
+    remove_parser.add_argument(
+        "--dedup-cache",
+        help="Directory to keep masks between runs so later batches can reuse them too"
+    )
+    remove_parser.add_argument(
+        "-b", "--batch-size",
+        type=int,
+        default=1,
+        help="Images per model call (higher is faster on GPU, uses more memory)"
+    )
+
+    # Stream Command
+    stream_parser = subparsers.add_parser(
+        "stream",
+        parents=[cache_parser],
+        help="Read images from stdin, write results to stdout",
+        formatter_class=argparse.RawTextHelpFormatter
+    )
+    stream_parser.add_argument(
+        "-f", "--input-format",
+        default="ndjson",
+        choices=["ndjson", "tar", "length"],
+        help=(
+            "ndjson : one {\"id\": ..., \"data\": <base64>} object per line (default)\n"
+            "tar    : tar stream, one image per file\n"
+            "length : 4-byte big-endian length + image bytes, repeated"
+        )
+    )
+    stream_parser.add_argument(
+        "-F", "--output-format",
+        choices=["ndjson", "tar", "length"],
+        help="Result format (default: same as input). PNG in every case"
+    )
+    stream_parser.add_argument("-m", "--model", default="u2net", choices=remover_engine.available_models(), help="AI Model (see 'remove --help')")
+    stream_parser.add_argument("--mask-only", action="store_true", help="Output only the grayscale mask")
+    stream_parser.add_argument("--refine", choices=list(QUALITY_PRESETS), help="Refine mask edges (see 'remove --help')")
+    stream_parser.add_argument("--optimize", action="store_true", help="Optimized torch profile (see 'remove --help')")
+    stream_parser.add_argument("-b", "--batch-size", type=int, default=8, help="Images per model call")
+
+    # Models Command
+    models_parser = subparsers.add_parser("models", help="Download, warm up or list models")
+    models_subparsers = models_parser.add_subparsers(dest="models_command", required=True)
+    pull_parser = models_subparsers.add_parser("pull", parents=[cache_parser], help="Download weights into the cache")
+    warmup_parser = models_subparsers.add_parser("warmup", parents=[cache_parser], help="Load models and run dummy passes")
+    list_parser = models_subparsers.add_parser("list", parents=[cache_parser], help="List available models")
+    benchmark_parser = models_subparsers.add_parser("benchmark", parents=[cache_parser], help="Time the default vs optimized profile")
+    for sub in (pull_parser, warmup_parser, list_parser, benchmark_parser):
+        sub.add_argument(
+            "-m", "--models",
+            nargs="+",
+            choices=remover_engine.available_models(),
+            help="Models to use (default: all)"
+        )
+    for sub in (warmup_parser, benchmark_parser):
+        sub.add_argument(
+            "-r", "--resolutions",
+            nargs="+",
+            type=int,
+            default=[remover_engine.DEFAULT_RESOLUTION],
+            help="Input resolutions to use (default: 1024)"
+        )
+    warmup_parser.add_argument("--runs", type=int, default=1, help="Dummy passes per resolution")
+    warmup_parser.add_argument("--optimize", action="store_true", help="Warm up (and compile) the optimized torch profile")
+    benchmark_parser.add_argument("--runs", type=int, default=10, help="Timed runs per profile")
+    benchmark_parser.add_argument("-b", "--batch-size", type=int, default=1, help="Images per model call")
+
+    # Watch Command
+    watch_parser = subparsers.add_parser("watch", parents=[cache_parser], help="Process images as they appear in a folder")
+    watch_parser.add_argument("directory", help="Folder to watch")
+    watch_parser.add_argument("-o", "--output", help="Output directory (default: <directory>/no_bg)")
+    watch_parser.add_argument("-m", "--model", default="u2net", choices=remover_engine.available_models(), help="AI Model (see 'remove --help')")
+    watch_parser.add_argument("-r", "--recursive", action="store_true", help="Also watch subfolders")
+    watch_parser.add_argument("--mask-only", action="store_true", help="Save only the grayscale mask")
+    watch_parser.add_argument("--refine", choices=list(QUALITY_PRESETS), help="Refine mask edges (see 'remove --help')")
+    watch_parser.add_argument("--optimize", action="store_true", help="Optimized torch profile (see 'remove --help')")
+    watch_parser.add_argument("-b", "--batch-size", type=int, default=8, help="Maximum images per model call")
+    watch_parser.add_argument("--batch-window", type=float, default=2.0, help="Seconds to collect arrivals before running a batch")
+    watch_parser.add_argument("--settle", type=float, default=1.0, help="Seconds a file must stay unchanged before it is read")
+    watch_parser.add_argument("--poll", action="store_true", help="Poll instead of using inotify/watchdog")
+    watch_parser.add_argument("--poll-interval", type=float, default=1.0, help="Seconds between scans in polling mode")
 
     args = parser.parse_args()
 
+    if args.command in ("remove", "models", "watch", "stream"):
+        # Must happen before any model library is imported
+        remover_engine.configure_model_cache(args.cache_dir, offline=args.offline)
+
     if args.command == "remove":
         process_removal(args)
+    elif args.command == "models":
+        manage_models(args)
+    elif args.command == "watch":
+        watch_folder(args)
+    elif args.command == "stream":
+        stream_images(args)
     else:
         parser.print_help()
 
@@ -0,0 +1,602 @@
+"""
+Common interface shared by all background removal models.
+
+Each model script (background_remover.py, birefnet_remover.py, ...)
+defines a Remover subclass and registers it under one or more model ids.
+main.py and the backend only talk to this module, so batching, caching
+and other pipeline features live here once instead of in every script.
+"""
+import os
+import importlib
+import threading
+import time
+import numpy as np
+from PIL import Image
+
+from image_io import LazyImage, save_result
+from matting import refine_alpha
+
+VALID_EXTS = {'.jpg', '.jpeg', '.png', '.bmp', '.webp'}
+
+# Default square resolution the segmentation models are run at
+DEFAULT_RESOLUTION = 1024
+
+# Region-of-interest mode: resolution of the cheap locating pass, and the
+# largest subject (as a fraction of the frame) still worth cropping to
+ROI_RESOLUTION = 256
+ROI_MAX_AREA = 0.6
+
+# Error reported for images where the model found no subject
+NO_MASK_ERROR = "No mask detected"
+
+# model id -> (Remover class, default options)
+_REGISTRY = {}
+
+# Built-in models live in their own scripts. They are imported on first
+# use so that e.g. torch is never imported when only u2net is needed.
+_BUILTIN_MODULES = {
+    "u2net": "background_remover",
+    "isnet": "background_remover",
+    "birefnet": "birefnet_remover",
+    "rmbg2": "rmbg2_remover",
+    "sam2": "sam2_remover",
+    "dummy": "dummy_remover",
+}
+
+# Loaded removers shared across calls (used by the API server)
+_LOADED = {}
+_LOADED_LOCK = threading.Lock()
+
+# Where model weights are stored (see configure_model_cache)
+CACHE_DIR_ENV = "BG_REMOVER_CACHE_DIR"
+OFFLINE_ENV = "BG_REMOVER_OFFLINE"
+
+
+def configure_model_cache(cache_dir=None, offline=False):
+    """
+    Points every model download (Hugging Face, rembg, ultralytics) at one
+    local directory and, if `offline` is set, forbids network access so
+    only already pulled weights are used.
+
+    Both settings can also come from the BG_REMOVER_CACHE_DIR and
+    BG_REMOVER_OFFLINE environment variables. Must run before the model
+    libraries are imported, since they read their cache paths on import.
+    """
+    if cache_dir:
+        os.environ[CACHE_DIR_ENV] = os.path.abspath(cache_dir)
+    if offline:
+        os.environ[OFFLINE_ENV] = "1"
+
+    cache_dir = os.environ.get(CACHE_DIR_ENV)
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+        os.environ["HF_HOME"] = os.path.join(cache_dir, "huggingface")
+        os.environ["U2NET_HOME"] = os.path.join(cache_dir, "rembg")
+
+    if is_offline():
+        os.environ["HF_HUB_OFFLINE"] = "1"
+        os.environ["TRANSFORMERS_OFFLINE"] = "1"
+        os.environ["YOLO_OFFLINE"] = "true"
+
+
+def is_offline():
+    return os.environ.get(OFFLINE_ENV, "").lower() in ("1", "true", "yes")
+
+
+def model_cache_path(*parts):
+    """Path inside the configured cache directory, or None if none is set."""
+    cache_dir = os.environ.get(CACHE_DIR_ENV)
+    if not cache_dir:
+        return None
+    return os.path.join(cache_dir, *parts)
+
+
+def register_remover(name, **defaults):
+    """
+    Class decorator that makes a Remover available under `name`.
+    `defaults` are passed to the constructor unless overridden.
+    """
+    def decorator(cls):
+        _REGISTRY[name] = (cls, defaults)
+        return cls
+    return decorator
+
+
+def available_models():
+    """Returns all model ids that can be passed to create_remover()."""
+    return sorted(set(_BUILTIN_MODULES) | set(_REGISTRY))
+
+
+def create_remover(name, **options):
+    """Creates a new (not yet loaded) Remover for the given model id."""
+    if name not in _REGISTRY and name in _BUILTIN_MODULES:
+        importlib.import_module(_BUILTIN_MODULES[name])
+    if name not in _REGISTRY:
+        raise ValueError(f"Unknown model '{name}'. Available: {', '.join(available_models())}")
+
+    cls, defaults = _REGISTRY[name]
+    kwargs = dict(defaults)
+    kwargs.update(options)
+    if kwargs.get("roi") == name:
+        # Locating with the same model is the low resolution self pass;
+        # going through get_remover would load the weights a second time
+        kwargs["roi"] = "self"
+    return cls(**kwargs)
+
+
+def get_remover(name, **options):
+    """
+    Returns a loaded Remover, reusing a previous instance with the same
+    options. Loading a model takes seconds, so long running processes
+    should always go through here.
+    """
+    key = (name, tuple(sorted(options.items())))
+    with _LOADED_LOCK:
+        remover = _LOADED.get(key)
+        if remover is None:
+            remover = create_remover(name, **options)
+            _LOADED[key] = remover
+    return remover.load()
+
+
+class Remover:
+    """
+    Base class for a background removal model.
+
+    Subclasses implement `_load()` and `predict_masks()`. Everything else
+    (decoding, resizing, compositing, batching) is shared.
+    """
+
+    # Human readable name used in log messages
+    label = "Remover"
+    # Whether the optimize=True execution profile is available
+    supports_optimize = False
+
+    def __init__(self, resolution=DEFAULT_RESOLUTION, model=None, refine=None, roi=None, roi_padding=0.1):
+        self.resolution = resolution
+        # Edge refinement preset from matting.QUALITY_PRESETS, or None
+        self.refine = refine
+        # Two-stage mode: None, "self" (low-res pass of this model) or
+        # another model id (e.g. "u2net") used to locate the subject
+        self.roi = roi
+        self.roi_padding = roi_padding
+        # An already loaded model can be passed in (see the process_* helpers)
+        self.model = model
+        self._load_lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self.model is not None
+
+    def load(self):
+        """Loads the model weights once. Returns self for chaining."""
+        if self.model is None:
+            with self._load_lock:
+                if self.model is None:
+                    self.model = self._load()
+        return self
+
+    def _load(self):
+        raise NotImplementedError
+
+    def pull(self):
+        """
+        Downloads the model weights into the cache without keeping the
+        model in memory. By default this just loads (and drops) the model.
+        """
+        if not self.loaded:
+            self._load()
+
+    def predict_masks(self, images, resolution=None):
+        """
+        Predicts a foreground mask for each RGB PIL image.
+
+        Returns a list with one grayscale ("L") PIL image per input, or None
+        where nothing was found. Masks may be smaller than the input;
+        callers scale them as needed.
+        """
+        raise NotImplementedError
+
+    def mask_input(self, image):
+        """
+        The PIL image predict_masks() receives for a LazyImage. The reduced
+        decode by default; models that need every pixel override this.
+        """
+        return image.model_input
+
+    def warmup(self, resolutions=None, runs=1):
+        """Runs dummy forward passes so the first real request is not slow."""
+        self.load()
+        for resolution in resolutions or [self.resolution]:
+            dummy = Image.new("RGB", (resolution, resolution), (127, 127, 127))
+            for _ in range(runs):
+                self.predict_masks([dummy], resolution=resolution)
+        return self
+
+    def process_batch(self, jobs, mask_only=False, dedup=None):
+        """
+        Removes the background for a list of (input_path, output_path)
+        pairs with a single batched model call. Returns the list of
+        output paths that were written.
+
+        `dedup` is an optional dedup.MaskIndex: near-duplicates of images
+        seen before (or earlier in this batch) reuse that mask instead of
+        running the model.
+        """
+        self.load()
+        images = [LazyImage(input_path, target_size=(self.resolution, self.resolution))
+                  for input_path, _ in jobs]
+
+        masks = [None] * len(images)
+        keys = [None] * len(images)
+        to_predict = list(range(len(images)))
+        # index -> index of a duplicate earlier in this batch
+        aliases = {}
+        if dedup is not None:
+            to_predict = []
+            for i, image in enumerate(images):
+                keys[i] = dedup.image_key(image.model_input)
+                masks[i] = dedup.find(keys[i])
+                if masks[i] is not None:
+                    continue
+                alias = next((j for j in to_predict if dedup.matches(keys[i], keys[j])), None)
+                if alias is None:
+                    to_predict.append(i)
+                else:
+                    aliases[i] = alias
+
+        if to_predict:
+            if self.roi:
+                predicted = self.predict_roi_masks([images[i] for i in to_predict])
+            else:
+                predicted = self.predict_masks([self.mask_input(images[i]) for i in to_predict])
+            for i, mask in zip(to_predict, predicted):
+                masks[i] = mask
+                if dedup is not None and mask is not None:
+                    dedup.add(keys[i], mask)
+        for i, j in aliases.items():
+            masks[i] = masks[j]
+            if masks[i] is not None:
+                dedup.reused += 1
+
+        written = []
+        for image, mask, (input_path, output_path) in zip(images, masks, jobs):
+            if mask is None:
+                print(f"⚠️ No mask detected for {getattr(input_path, 'name', input_path)}")
+                image.release()
+                continue
+            if self.refine:
+                # Refine against the pixels that will actually be written
+                guide = image.model_input if mask_only else image.full()
+                mask = refine_alpha(guide, mask, quality=self.refine)
+            save_result(image, mask, output_path, mask_only=mask_only)
+            print(f"✅ Saved to: {getattr(output_path, 'name', output_path)}")
+            written.append(output_path)
+        return written
+
+    def process_batch_isolated(self, jobs, mask_only=False, dedup=None, fresh_output=None):
+        """
+        process_batch() for bulk and long running callers: if the batched
+        call raises, every image is retried on its own, so one bad file
+        only fails itself. Returns one (output_path, error) pair per job,
+        with error None where the output was written.
+
+        `fresh_output(output_path)`, if given, supplies a replacement for
+        each output before the retry (e.g. a new buffer, since the failed
+        attempt may have written part of the old one). The returned
+        output_path is the one actually written.
+        """
+        state = dedup.checkpoint() if dedup is not None else None
+        failures = {}
+        try:
+            written = self.process_batch(jobs, mask_only=mask_only, dedup=dedup)
+        except Exception as e:
+            written = []
+            if dedup is not None:
+                # Masks from the failed attempt would otherwise count as reused
+                dedup.rollback(state)
+            if len(jobs) == 1:
+                failures[0] = e
+            else:
+                print(f"⚠️ Batch failed ({e}), retrying images one by one")
+                retried = []
+                for i, (input_path, output_path) in enumerate(jobs):
+                    if fresh_output is not None:
+                        output_path = fresh_output(output_path)
+                    retried.append((input_path, output_path))
+                    try:
+                        written.extend(self.process_batch([(input_path, output_path)], mask_only=mask_only, dedup=dedup))
+                    except Exception as e:
+                        failures[i] = e
+                jobs = retried
+
+        results = []
+        for i, (input_path, output_path) in enumerate(jobs):
+            if i in failures:
+                error = f"{type(failures[i]).__name__}: {failures[i]}"
+                print(f"❌ Failed to process {getattr(input_path, 'name', input_path)}: {error}")
+            elif not any(output_path is w for w in written):
+                # Already reported by process_batch
+                error = NO_MASK_ERROR
+            else:
+                error = None
+            results.append((output_path, error))
+        return results
+
+    def predict_roi_masks(self, images):
+        """
+        Two-stage prediction for LazyImages: a cheap low resolution pass
+        finds the subject, then the model runs only on the padded crop and
+        the mask is pasted back into full-frame coordinates. Small subjects
+        get the model's full resolution; large ones fall back to the frame.
+        """
+        if self.roi == "self":
+            locator, locate_resolution = self, ROI_RESOLUTION
+        else:
+            locator, locate_resolution = get_remover(self.roi), None
+
+        coarse = locator.predict_masks([image.model_input for image in images], resolution=locate_resolution)
+
+        boxes = []
+        inputs = []
+        for image, mask in zip(images, coarse):
+            box = subject_box(mask, self.roi_padding) if mask is not None else None
+            if box is not None and (box[2] - box[0]) * (box[3] - box[1]) > ROI_MAX_AREA:
+                box = None
+            boxes.append(box)
+            inputs.append(image.crop(box, self.resolution) if box else self.mask_input(image))
+
+        masks = self.predict_masks(inputs)
+
+        results = []
+        for image, box, mask in zip(images, boxes, masks):
+            if box is None or mask is None:
+                results.append(mask)
+                continue
+            # Canvas just large enough to keep the crop mask's detail
+            w, h = image.size
+            scale = min(1.0, max(mask.size[0] / ((box[2] - box[0]) * w), mask.size[1] / ((box[3] - box[1]) * h)))
+            canvas_w, canvas_h = max(1, int(w * scale)), max(1, int(h * scale))
+            left, top = int(box[0] * canvas_w), int(box[1] * canvas_h)
+            right, bottom = int(round(box[2] * canvas_w)), int(round(box[3] * canvas_h))
+
+            canvas = Image.new("L", (canvas_w, canvas_h), 0)
+            canvas.paste(mask.convert("L").resize((max(1, right - left), max(1, bottom - top)), Image.Resampling.BILINEAR), (left, top))
+            results.append(canvas)
+        return results
+
+    def process_preview(self, input_path, output_path, resolution=512):
+        """
+        Quick low resolution cutout for progressive display. The model runs
+        at `resolution` and the cutout is written at about that size, so
+        neither the full decode nor refinement is paid for.
+        """
+        self.load()
+        image = LazyImage(input_path, target_size=(resolution, resolution))
+        preview = image.model_input
+        preview.thumbnail((resolution, resolution))
+
+        mask = self.predict_masks([preview], resolution=resolution)[0]
+        if mask is None:
+            return None
+        preview.putalpha(mask.convert("L").resize(preview.size, Image.Resampling.BILINEAR))
+        preview.save(output_path)
+        return output_path
+
+    def process_file(self, input_path, output_path, mask_only=False):
+        """Processes a single image. Returns the output path or None."""
+        written = self.process_batch([(input_path, output_path)], mask_only=mask_only)
+        return written[0] if written else None
+
+
+class TorchSegmentationRemover(Remover):
+    """
+    Remover for Hugging Face image segmentation models that follow the
+    BiRefNet interface (BiRefNet itself and RMBG-2.0).
+    """
+
+    repo_id = None
+    supports_optimize = True
+
+    def __init__(self, optimize=False, **options):
+        super().__init__(**options)
+        # Opt-in profile: inference_mode, channels-last, torch.compile
+        self.optimize = optimize
+        self._forward = None
+        self._transforms = {}
+
+    def pull(self):
+        from huggingface_hub import snapshot_download
+        # Weights and the remote modeling code are both part of the snapshot
+        snapshot_download(self.repo_id, cache_dir=model_cache_path("huggingface", "hub"))
+
+    def _transform(self, resolution):
+        if resolution not in self._transforms:
+            _, _, transforms = self.model
+            self._transforms[resolution] = transforms.Compose([
+                transforms.Resize((resolution, resolution)),
+                transforms.ToTensor(),
+                transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
+            ])
+        return self._transforms[resolution]
+
+    def _optimized_forward(self):
+        """
+        Prepares the compiled model once. torch.compile is lazy, so errors
+        in the remote modeling code only show up on the first call; see
+        predict_masks for that fallback.
+        """
+        import torch
+        model, device, _ = self.model
+
+        try:
+            model.to(memory_format=torch.channels_last)
+        except Exception as e:
+            print(f"⚠️ channels-last not supported: {e}")
+
+        # Keep compiled kernels next to the model weights (read lazily by inductor)
+        cache_dir = model_cache_path("torchinductor")
+        if cache_dir:
+            os.environ.setdefault("TORCHINDUCTOR_CACHE_DIR", cache_dir)
+
+        try:
+            import torch._inductor.config as inductor_config
+            # Reuse compiled kernels across restarts (keyed by input shape)
+            inductor_config.fx_graph_cache = True
+            if device == "cpu":
+                # Fold weights into the graph so inductor can use fused oneDNN kernels
+                inductor_config.freezing = True
+                inductor_config.cpp.weight_prepack = True
+            # Shapes are fixed by the resolution, so skip dynamic shape tracing
+            return torch.compile(model, dynamic=False)
+        except Exception as e:
+            print(f"⚠️ torch.compile unavailable, using eager mode: {e}")
+            return model
+
+    def predict_masks(self, images, resolution=None):
+        import torch
+        from torchvision.transforms.functional import to_pil_image
+
+        self.load()
+        model, device, _ = self.model
+        transform = self._transform(resolution or self.resolution)
+
+        input_tensor = torch.stack([transform(image) for image in images]).to(device)
+
+        if not self.optimize:
+            with torch.no_grad():
+                preds = model(input_tensor)[-1].sigmoid().cpu()
+            return [to_pil_image(pred.squeeze()) for pred in preds]
+
+        if self._forward is None:
+            with self._load_lock:
+                if self._forward is None:
+                    self._forward = self._optimized_forward()
+
+        input_tensor = input_tensor.contiguous(memory_format=torch.channels_last)
+        with torch.inference_mode():
+            try:
+                preds = self._forward(input_tensor)[-1].sigmoid().cpu()
+            except Exception as e:
+                if self._forward is model:
+                    raise
+                # Compilation of trust_remote_code models can fail; keep the rest of the profile
+                print(f"⚠️ Compiled {self.label} failed ({type(e).__name__}: {e}), falling back to eager mode")
+                self._forward = model
+                preds = model(input_tensor)[-1].sigmoid().cpu()
+
+        return [to_pil_image(pred.squeeze()) for pred in preds]
+
+
+def benchmark(remover, resolution=None, batch_size=1, runs=10, warmup_runs=2):
+    """
+    Times predict_masks on seeded noise images. Warmup runs (which also
+    trigger compilation in the optimized profile) are not counted.
+    Returns the seconds taken by each timed batch.
+    """
+    resolution = resolution or remover.resolution
+    rng = np.random.default_rng(0)
+    images = [Image.fromarray(rng.integers(0, 256, (resolution, resolution, 3), dtype=np.uint8))
+              for _ in range(batch_size)]
+
+    remover.load()
+    for _ in range(warmup_runs):
+        remover.predict_masks(images, resolution=resolution)
+
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        remover.predict_masks(images, resolution=resolution)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def subject_box(mask, padding=0.1, threshold=32):
+    """
+    Bounding box of the foreground in `mask` as fractions of its size
+    (left, top, right, bottom), grown by `padding` times the box size on
+    each side. Returns None for an empty mask.
+    """
+    alpha = np.asarray(mask.convert("L")) > threshold
+    rows = np.flatnonzero(alpha.any(axis=1))
+    if rows.size == 0:
+        return None
+    cols = np.flatnonzero(alpha.any(axis=0))
+
+    h, w = alpha.shape
+    left, right = cols[0] / w, (cols[-1] + 1) / w
+    top, bottom = rows[0] / h, (rows[-1] + 1) / h
+    # At least 2% of the frame, so tight boxes keep some context
+    pad_x = max(0.02, (right - left) * padding)
+    pad_y = max(0.02, (bottom - top) * padding)
+    return (max(0.0, left - pad_x), max(0.0, top - pad_y), min(1.0, right + pad_x), min(1.0, bottom + pad_y))
+
+
+def load_hf_segmentation_model(repo_id):
+    """Loads a trust_remote_code segmentation model. Returns (model, device, transforms)."""
+    import torch
+    from transformers import AutoModelForImageSegmentation
+    from torchvision import transforms
+
+    # Enable high precision for matmul if available
+    try:
+        torch.set_float32_matmul_precision(['high', 'medium'][0])
+    except Exception:
+        pass
+
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+
+    model = AutoModelForImageSegmentation.from_pretrained(
+        repo_id,
+        trust_remote_code=True,
+        cache_dir=model_cache_path("huggingface", "hub"),
+        local_files_only=is_offline()
+    )
+    model.to(device)
+    model.eval()
+    return model, device, transforms
+
+
+# --- CLI helpers shared by the model scripts ---
+
+def reconstruct_paths(raw_args):
+    """
+    Rejoins paths that the shell split on spaces (missing quotes).
+    Parts are accumulated until they form an existing path.
+    """
+    cleaned_paths = []
+    current_path = []
+
+    for arg in raw_args:
+        current_path.append(arg)
+        candidate = " ".join(current_path)
+        candidate_clean = candidate.strip('"').strip("'")
+
+        if os.path.exists(candidate_clean):
+            cleaned_paths.append(candidate_clean)
+            current_path = []
+
+    # Leftovers are kept so the caller can report "File not found"
+    if current_path:
+        cleaned_paths.append(" ".join(current_path).strip('"').strip("'"))
+
+    return cleaned_paths
+
+
+def is_image_file(path):
+    return os.path.splitext(path)[1].lower() in VALID_EXTS
+
+
+def output_path_for(input_path, output_target, suffix):
+    """
+    Output naming used by the model scripts: next to the input when no
+    target is given, inside `output_target` if it is a directory, or
+    `output_target` itself otherwise.
+    """
+    if not output_target:
+        base, _ = os.path.splitext(input_path)
+        return f"{base}{suffix}.png"
+    if os.path.isdir(output_target):
+        base, _ = os.path.splitext(os.path.basename(input_path))
+        return os.path.join(output_target, f"{base}{suffix}.png")
+    return output_target
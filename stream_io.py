@@ -0,0 +1,211 @@
+"""
+Pipe-friendly batch protocol: images come in on stdin and results go out
+on stdout, so the tool can sit between other streaming tools without a
+scratch volume.
+
+Supported formats (input and output):
+    ndjson  one JSON object per line: {"id": "...", "data": "<base64>"}
+            results add "error" instead of "data" when an image failed
+    tar     a tar stream; each regular file is one image, results are
+            named <name>_no_bg.png (or _mask.png)
+    length  each image is a 4-byte big-endian length followed by the
+            bytes; a zero length result marks a failed image
+"""
+import base64
+import io
+import json
+import os
+import struct
+import sys
+import tarfile
+import time
+
+# --- Readers: yield (id, image bytes, error) ---
+# A record that can't be decoded yields (id, None, error) so only that
+# image fails. A broken stream (truncated tar or length frame) raises.
+
+def read_ndjson(stream):
+    for line_number, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line:
+            continue
+        item_id = str(line_number)
+        try:
+            record = json.loads(line)
+            if not isinstance(record, dict):
+                raise ValueError("record is not a JSON object")
+            item_id = str(record.get("id", line_number))
+            if "data" not in record:
+                raise ValueError("record has no 'data'")
+            data = base64.b64decode(record["data"])
+        except ValueError as e:
+            # json.JSONDecodeError and binascii.Error are ValueErrors
+            yield item_id, None, f"Invalid record: {e}"
+            continue
+        yield item_id, data, None
+
+
+def read_tar(stream):
+    with tarfile.open(fileobj=stream, mode="r|*") as tar:
+        for member in tar:
+            if member.isfile():
+                yield member.name, tar.extractfile(member).read(), None
+
+
+def _read_exact(stream, size):
+    chunks = []
+    while size:
+        chunk = stream.read(size)
+        if not chunk:
+            raise EOFError("Stream ended in the middle of a record")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def read_length_prefixed(stream):
+    index = 0
+    while True:
+        header = stream.read(4)
+        if not header:
+            return
+        if len(header) < 4:
+            header += _read_exact(stream, 4 - len(header))
+        (size,) = struct.unpack(">I", header)
+        yield str(index), _read_exact(stream, size), None
+        index += 1
+
+
+READERS = {"ndjson": read_ndjson, "tar": read_tar, "length": read_length_prefixed}
+
+
+# --- Writers ---
+
+class NdjsonWriter:
+    def __init__(self, stream, suffix):
+        self.stream = stream
+
+    def write(self, item_id, data, error=None):
+        record = {"id": item_id}
+        if error is None:
+            record["data"] = base64.b64encode(data).decode("ascii")
+        else:
+            record["error"] = error
+        self.stream.write(json.dumps(record).encode("utf-8") + b"\n")
+        self.stream.flush()
+
+    def close(self):
+        self.stream.flush()
+
+
+class TarWriter:
+    def __init__(self, stream, suffix):
+        self.suffix = suffix
+        self.stream = stream
+        self.tar = tarfile.open(fileobj=stream, mode="w|")
+
+    def write(self, item_id, data, error=None):
+        if error is not None:
+            # tar has no place for errors; they are already logged to stderr
+            return
+        info = tarfile.TarInfo(f"{os.path.splitext(item_id)[0]}{self.suffix}.png")
+        info.size = len(data)
+        info.mtime = int(time.time())
+        self.tar.addfile(info, io.BytesIO(data))
+        self.stream.flush()
+
+    def close(self):
+        self.tar.close()
+        self.stream.flush()
+
+
+class LengthPrefixedWriter:
+    def __init__(self, stream, suffix):
+        self.stream = stream
+
+    def write(self, item_id, data, error=None):
+        data = b"" if error is not None else data
+        self.stream.write(struct.pack(">I", len(data)) + data)
+        self.stream.flush()
+
+    def close(self):
+        self.stream.flush()
+
+
+WRITERS = {"ndjson": NdjsonWriter, "tar": TarWriter, "length": LengthPrefixedWriter}
+
+
+def claim_stdout():
+    """
+    Returns a binary handle to the real stdout and points file descriptor 1
+    at stderr, so log output (ours, or from native libraries) can never
+    corrupt the result stream.
+    """
+    sys.stdout.flush()
+    out = os.fdopen(os.dup(1), "wb")
+    os.dup2(2, 1)
+    sys.stdout = sys.stderr
+    return out
+
+
+def process_stream(remover, input_stream, output_stream, input_format="ndjson", output_format=None,
+                   batch_size=8, mask_only=False):
+    """
+    Reads images from `input_stream`, runs them through `remover` in
+    batches and writes results in order. Returns (processed, failed).
+    """
+    suffix = "_mask" if mask_only else "_no_bg"
+    writer = WRITERS[output_format or input_format](output_stream, suffix)
+    processed = failed = 0
+
+    def fail(item_id, error):
+        nonlocal failed
+        writer.write(item_id, None, error=error)
+        failed += 1
+
+    def fresh_output(output):
+        # The failed batched attempt may already have written to the old buffer
+        replacement = io.BytesIO()
+        replacement.name = output.name
+        return replacement
+
+    def flush(batch):
+        nonlocal processed
+        if not batch:
+            return
+        jobs = []
+        for item_id, data in batch:
+            source, output = io.BytesIO(data), io.BytesIO()
+            # Used in log messages in place of a file path
+            source.name = output.name = item_id
+            jobs.append((source, output))
+        # Failures are logged by the engine
+        results = remover.process_batch_isolated(jobs, mask_only=mask_only, fresh_output=fresh_output)
+        for (item_id, _), (output, error) in zip(batch, results):
+            if error is None:
+                writer.write(item_id, output.getvalue())
+                processed += 1
+            else:
+                fail(item_id, error)
+
+    batch = []
+    try:
+        for item_id, data, error in READERS[input_format](input_stream):
+            if error is not None:
+                # Results stay in input order, so the pending batch goes first
+                pending, batch = batch, []
+                flush(pending)
+                print(f"❌ Failed to read {item_id}: {error}", file=sys.stderr)
+                fail(item_id, error)
+                continue
+            batch.append((item_id, data))
+            if len(batch) >= batch_size:
+                pending, batch = batch, []
+                flush(pending)
+    finally:
+        # Also runs when the input breaks off, so images already read are not lost
+        try:
+            flush(batch)
+        finally:
+            writer.close()
+    return processed, failed
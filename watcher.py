@@ -0,0 +1,247 @@
+"""
+Watch-folder mode: keeps one model loaded and processes images as they
+appear in a directory.
+
+New or changed files are picked up through inotify (via the optional
+`watchdog` package) or, if that isn't installed, by polling. A file is
+only processed once its size and modification time have stopped changing
+for `settle` seconds, so half-copied files are never read. Ready files
+are grouped into batches over a short time window, outputs are written
+atomically, and a small JSON index in the output directory records what
+has been done so a restart does not reprocess anything.
+"""
+import json
+import os
+import threading
+import time
+
+from remover_engine import is_image_file
+
+STATE_FILENAME = ".bg_remover_state.json"
+
+# Names used by copy tools / browsers for files that are still being written
+PARTIAL_SUFFIXES = ('.tmp', '.part', '.partial', '.crdownload', '.download', '~')
+
+
+def file_signature(path):
+    """(size, mtime_ns) or None if the file is gone."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+def is_inside(path, directory):
+    """True if `path` is `directory` or below it."""
+    try:
+        return os.path.commonpath([path, directory]) == directory
+    except ValueError:
+        # Different drives on Windows
+        return False
+
+
+def load_state(state_path):
+    try:
+        with open(state_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_state(state_path, state):
+    # Write-then-rename so a crash never leaves a truncated index
+    tmp_path = state_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=1)
+    os.replace(tmp_path, state_path)
+
+
+class FolderWatcher:
+    def __init__(self, remover, watch_dir, output_dir=None, recursive=False, settle=1.0,
+                 batch_window=2.0, batch_size=8, mask_only=False, poll_interval=1.0, use_polling=False):
+        self.remover = remover
+        self.watch_dir = os.path.abspath(watch_dir)
+        self.output_dir = os.path.abspath(output_dir or os.path.join(self.watch_dir, "no_bg"))
+        self.recursive = recursive
+        self.settle = settle
+        self.batch_window = batch_window
+        self.batch_size = max(1, batch_size)
+        self.mask_only = mask_only
+        self.poll_interval = poll_interval
+        self.use_polling = use_polling
+        self.suffix = "_mask" if mask_only else "_no_bg"
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        self.state_path = os.path.join(self.output_dir, STATE_FILENAME)
+        self.state = load_state(self.state_path)
+
+        # path -> (last seen signature, monotonic time it was first seen unchanged)
+        self.pending = {}
+        self.ready = []
+        self.batch_started = None
+        self._events = set()
+        self._events_lock = threading.Lock()
+
+    # --- Discovery ---
+
+    def wants(self, path):
+        name = os.path.basename(path)
+        if name.startswith(".") or name.lower().endswith(PARTIAL_SUFFIXES):
+            return False
+        if not is_image_file(path):
+            return False
+        # Never pick up our own outputs
+        if is_inside(path, self.output_dir):
+            return False
+        if not self.recursive and os.path.dirname(path) != self.watch_dir:
+            return False
+        return True
+
+    def is_done(self, path, signature):
+        entry = self.state.get(path)
+        return entry is not None and (entry["size"], entry["mtime_ns"]) == tuple(signature)
+
+    def scan(self):
+        """Full directory scan: used at startup and in polling mode."""
+        for root, dirs, files in os.walk(self.watch_dir):
+            if not self.recursive:
+                dirs.clear()
+            for name in files:
+                self.notice(os.path.join(root, name))
+
+    def notice(self, path):
+        path = os.path.abspath(path)
+        if path in self.pending or path in self.ready or not self.wants(path):
+            return
+        signature = file_signature(path)
+        if signature is None or self.is_done(path, signature):
+            return
+        self.pending[path] = (signature, time.monotonic())
+
+    def start_observer(self):
+        """Starts an inotify (watchdog) observer. Returns None if unavailable."""
+        if self.use_polling:
+            return None
+        try:
+            from watchdog.observers import Observer
+            from watchdog.events import FileSystemEventHandler
+        except ImportError:
+            print("ℹ️ watchdog not installed, falling back to polling (pip install watchdog)")
+            return None
+
+        watcher = self
+
+        class Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                if event.is_directory:
+                    return
+                # Moves (e.g. "save as temp, rename") report the final name in dest_path
+                path = getattr(event, "dest_path", None) or event.src_path
+                with watcher._events_lock:
+                    watcher._events.add(path)
+
+        observer = Observer()
+        observer.schedule(Handler(), self.watch_dir, recursive=self.recursive)
+        observer.start()
+        return observer
+
+    def drain_events(self):
+        with self._events_lock:
+            events, self._events = self._events, set()
+        for path in events:
+            self.notice(path)
+
+    # --- Settling and batching ---
+
+    def check_pending(self):
+        now = time.monotonic()
+        for path, (signature, since) in list(self.pending.items()):
+            current = file_signature(path)
+            if current is None:
+                del self.pending[path]
+            elif current != signature:
+                # Still being written: restart the settle timer
+                self.pending[path] = (current, now)
+            elif now - since >= self.settle:
+                del self.pending[path]
+                self.ready.append(path)
+                if self.batch_started is None:
+                    self.batch_started = now
+
+    def batch_due(self):
+        if not self.ready:
+            return False
+        return (len(self.ready) >= self.batch_size
+                or time.monotonic() - self.batch_started >= self.batch_window)
+
+    def output_path(self, path):
+        # Mirror subdirectories of the watch folder in the output folder
+        rel_dir = os.path.relpath(os.path.dirname(path), self.watch_dir)
+        base = os.path.splitext(os.path.basename(path))[0]
+        return os.path.normpath(os.path.join(self.output_dir, rel_dir, f"{base}{self.suffix}.png"))
+
+    def process_ready(self):
+        batch, self.ready = self.ready[:self.batch_size], self.ready[self.batch_size:]
+        self.batch_started = time.monotonic() if self.ready else None
+
+        jobs = []
+        for path in batch:
+            final_path = self.output_path(path)
+            os.makedirs(os.path.dirname(final_path), exist_ok=True)
+            # Hidden temp name keeps the .png extension so PIL picks the format
+            tmp_path = os.path.join(os.path.dirname(final_path), f".{os.path.basename(final_path)}.tmp.png")
+            jobs.append((path, tmp_path, final_path, file_signature(path)))
+
+        start_time = time.time()
+        results = self.remover.process_batch_isolated([(p, tmp) for p, tmp, _, _ in jobs], mask_only=self.mask_only)
+        written = {tmp_path for tmp_path, error in results if error is None}
+
+        for path, tmp_path, final_path, signature in jobs:
+            if tmp_path in written:
+                os.replace(tmp_path, final_path)
+                print(f"✅ {os.path.basename(path)} -> {final_path}")
+            elif os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            # Failed files are recorded too, so they are only retried once they change
+            if signature is not None:
+                self.state[path] = {
+                    "size": signature[0],
+                    "mtime_ns": signature[1],
+                    "output": final_path if tmp_path in written else None,
+                }
+        save_state(self.state_path, self.state)
+        print(f"📦 Batch of {len(jobs)} done in {time.time() - start_time:.2f}s")
+
+    # --- Main loop ---
+
+    def run(self):
+        print(f"👀 Watching {self.watch_dir}{' (recursive)' if self.recursive else ''}")
+        print(f"   Output: {self.output_dir}")
+
+        # Start watching before the initial scan, so files arriving in
+        # between are not missed (notice() ignores duplicates)
+        observer = self.start_observer()
+        # Pick up anything that arrived while we were not running
+        self.scan()
+        last_scan = time.monotonic()
+
+        try:
+            while True:
+                if observer is not None:
+                    self.drain_events()
+                elif time.monotonic() - last_scan >= self.poll_interval:
+                    self.scan()
+                    last_scan = time.monotonic()
+
+                self.check_pending()
+                if self.batch_due():
+                    self.process_ready()
+                else:
+                    time.sleep(0.2)
+        except KeyboardInterrupt:
+            print("\n👋 Stopping watcher")
+        finally:
+            if observer is not None:
+                observer.stop()
+                observer.join()